@@ -1,147 +1,467 @@
 import os
-import aiosqlite
+import atexit
+import sqlite3
+import asyncio
+import functools
+import threading
+from pathlib import Path
+from concurrent.futures import ThreadPoolExecutor
 from fastmcp import FastMCP
+from pydantic import BaseModel
 from typing import Optional
+from decimal import Decimal, ROUND_HALF_UP
+import math
 import tempfile
-
-mcp = FastMCP("Expense Tracker")
+import orjson
+from fastmcp.tools.tool import ToolResult
 
 TEMP_DIR = tempfile.gettempdir()
 DB_PATH = os.path.join(TEMP_DIR, "expenses.db")
 CATEGORIES_PATH = os.path.join(os.path.dirname(__file__), "categories.json")
 
+# Connection settings, applied to the writer in init_db() and to each reader as it opens.
+# synchronous only matters to the writer, so it is set in WRITER_PRAGMAS alone.
+PRAGMAS = (
+    "PRAGMA temp_store=MEMORY",
+    "PRAGMA mmap_size=268435456",
+    "PRAGMA cache_size=-64000",
+)
+
+# Relaxed durability for the writer: commits are not fsynced, so a power loss or OS
+# crash can drop the last few seconds of writes (a crash of this process loses nothing).
+# Use synchronous=FULL here for durable commits; NORMAL avoids corruption but can still
+# lose the last commits.
+WRITER_PRAGMAS = (
+    "PRAGMA synchronous=OFF",
+    "PRAGMA wal_autocheckpoint=1000",
+)
+# How often idle WAL content is copied back into the main database file
+CHECKPOINT_INTERVAL = 5.0
+
+# Largest amount accepted, well inside the 64-bit range of the integer cents columns
+MAX_AMOUNT = 10**12
+CENT = Decimal("0.01")
+
+# list_expenses returns at most this many rows per call, see its cursor argument
+LIST_PAGE_SIZE = 512
+
+# sqlite3 keeps compiled statements keyed by SQL text, so the hot queries live
+# in fixed strings and the cache is sized well above the number we use
+STATEMENT_CACHE_SIZE = 256
+
+# Column names of the LIST_SQL and SUMMARY_*_SQL results, returned alongside the rows
+LIST_COLUMNS = ("id", "date", "amount", "category", "subcategory", "note")
+SUMMARY_COLUMNS = ("category", "total_amount")
+
+# Amounts are stored as integer cents and only turned back into decimals on the way out
+INSERT_SQL = "INSERT INTO expenses(date, amount_cents, category, subcategory, note) VALUES (?,?,?,?,?)"
+LIST_SQL = """
+SELECT id, date, amount_cents / 100.0 AS amount, category, subcategory, note
+FROM expenses
+WHERE date BETWEEN ? AND ? AND (date, id) > (?, ?)
+ORDER BY date ASC, id ASC
+LIMIT ?
+"""
+# NULL parameters leave the column unchanged, so one statement covers every edit
+UPDATE_SQL = """
+UPDATE expenses
+SET amount_cents = COALESCE(?, amount_cents), category = COALESCE(?, category), note = COALESCE(?, note)
+WHERE date = ? and subcategory = ?
+"""
+DELETE_SQL = "DELETE FROM expenses WHERE date = ? and subcategory = ?"
+# summarize reads the per-day totals in expense_rollup rather than every expense
+SUMMARY_SQL = """
+SELECT category, SUM(total_cents) / 100.0 AS total_amount
+FROM expense_rollup
+WHERE date BETWEEN ? AND ?
+GROUP BY category ORDER BY category ASC
+"""
+SUMMARY_BY_CATEGORY_SQL = """
+SELECT category, SUM(total_cents) / 100.0 AS total_amount
+FROM expense_rollup
+WHERE date BETWEEN ? AND ? AND category = ?
+GROUP BY category ORDER BY category ASC
+"""
+
+# Keep expense_rollup in step with expenses inside the writing transaction
+ROLLUP_TRIGGERS = {
+    "expenses_rollup_insert": """
+    CREATE TRIGGER expenses_rollup_insert AFTER INSERT ON expenses BEGIN
+        INSERT INTO expense_rollup(date, category, total_cents, cnt) VALUES (new.date, new.category, new.amount_cents, 1)
+        ON CONFLICT(date, category) DO UPDATE SET total_cents = total_cents + excluded.total_cents, cnt = cnt + 1;
+    END
+    """,
+    "expenses_rollup_delete": """
+    CREATE TRIGGER expenses_rollup_delete AFTER DELETE ON expenses BEGIN
+        UPDATE expense_rollup SET total_cents = total_cents - old.amount_cents, cnt = cnt - 1
+        WHERE date = old.date AND category = old.category;
+        DELETE FROM expense_rollup WHERE date = old.date AND category = old.category AND cnt = 0;
+    END
+    """,
+    "expenses_rollup_update": """
+    CREATE TRIGGER expenses_rollup_update AFTER UPDATE OF date, amount_cents, category ON expenses BEGIN
+        UPDATE expense_rollup SET total_cents = total_cents - old.amount_cents, cnt = cnt - 1
+        WHERE date = old.date AND category = old.category;
+        DELETE FROM expense_rollup WHERE date = old.date AND category = old.category AND cnt = 0;
+        INSERT INTO expense_rollup(date, category, total_cents, cnt) VALUES (new.date, new.category, new.amount_cents, 1)
+        ON CONFLICT(date, category) DO UPDATE SET total_cents = total_cents + excluded.total_cents, cnt = cnt + 1;
+    END
+    """,
+}
+
+# add_expense calls are queued and written in batches, one commit per batch
+INSERT_BATCH_SIZE = 128
+
+_categories_cache = {"mtime": None, "data": None}
+
+# WAL lets one writer run alongside any number of readers, so writes go through
+# a single connection on a single thread and reads through a small read-only pool
+READER_COUNT = 4
+
+# The writer is opened once for the life of the process.
+# isolation_level=None leaves transactions to explicit BEGIN/COMMIT.
+_WRITE_CONN = sqlite3.connect(
+    DB_PATH, isolation_level=None, check_same_thread=False, cached_statements=STATEMENT_CACHE_SIZE
+)
+
+def close_db():
+    # Lets SQLite refresh planner statistics for whatever this process queried
+    try:
+        _WRITE_CONN.execute("PRAGMA optimize")
+    except sqlite3.Error:
+        pass
+    _WRITE_CONN.close()
+
+atexit.register(close_db)
+
+_reader = threading.local()
+
+def _open_reader():
+    c = sqlite3.connect(
+        f"{Path(DB_PATH).as_uri()}?mode=ro", uri=True, cached_statements=STATEMENT_CACHE_SIZE
+    )
+    for pragma in PRAGMAS:
+        try:
+            c.execute(pragma)
+        except sqlite3.OperationalError:
+            pass
+    _reader.conn = c
+
+WRITE_EXECUTOR = ThreadPoolExecutor(max_workers=1, thread_name_prefix="expenses-write")
+# Each reader thread opens its own connection when it starts
+READ_EXECUTOR = ThreadPoolExecutor(
+    max_workers=READER_COUNT, thread_name_prefix="expenses-read", initializer=_open_reader
+)
+
+_insert_queue: Optional[asyncio.Queue] = None
+_flusher: Optional[asyncio.Task] = None
+_checkpointer: Optional[asyncio.Task] = None
+# Set by run_write once a write succeeds, cleared when the checkpointer picks it up
+_wal_dirty = False
+
+async def run_read(fn, *args):
+    return await asyncio.get_running_loop().run_in_executor(READ_EXECUTOR, fn, *args)
+
+async def run_write(fn, *args):
+    global _checkpointer, _wal_dirty
+    if _checkpointer is None or _checkpointer.done():
+        _checkpointer = asyncio.create_task(_checkpoint_periodically())
+    result = await asyncio.get_running_loop().run_in_executor(WRITE_EXECUTOR, fn, *args)
+    _wal_dirty = True
+    return result
+
+def _query(sql, params):
+    return _reader.conn.execute(sql, params).fetchall()
+
+def _write_many(sql, params_seq):
+    # One transaction, and so one commit, for the whole batch
+    c = _WRITE_CONN
+    with c:
+        c.execute("BEGIN")
+        return c.executemany(sql, params_seq).rowcount
+
+def _insert_rows(rows):
+    c = _WRITE_CONN
+    with c:
+        c.execute("BEGIN")
+        c.executemany(INSERT_SQL, rows)
+        (last_id,) = c.execute("SELECT last_insert_rowid()").fetchone()
+    # Rows of one batch get consecutive ids
+    return last_id - len(rows) + 1
+
+async def _flush_inserts(queue: asyncio.Queue):
+    while True:
+        # Write whatever piled up while the previous batch was committing;
+        # a lone insert is written straight away rather than waiting for company
+        batch = [await queue.get()]
+        while len(batch) < INSERT_BATCH_SIZE and not queue.empty():
+            batch.append(queue.get_nowait())
+        try:
+            first_id = await run_write(_insert_rows, [row for row, _ in batch])
+        except Exception:
+            # The batch was rolled back; retry each row on its own so only
+            # the caller whose row fails gets the error
+            for row, fut in batch:
+                try:
+                    row_id = await run_write(_insert_rows, [row])
+                except Exception as e:
+                    if not fut.done():
+                        fut.set_exception(e)
+                else:
+                    if not fut.done():
+                        fut.set_result(row_id)
+            continue
+        for i, (_, fut) in enumerate(batch):
+            if not fut.done():
+                fut.set_result(first_id + i)
+
+def _checkpoint():
+    try:
+        _WRITE_CONN.execute("PRAGMA wal_checkpoint(PASSIVE)")
+    except sqlite3.Error:
+        pass
+
+async def _checkpoint_periodically():
+    global _wal_dirty
+    # Keeps the WAL short between automatic checkpoints
+    while True:
+        await asyncio.sleep(CHECKPOINT_INTERVAL)
+        if not _wal_dirty:
+            continue
+        _wal_dirty = False
+        # Straight to the executor: going through run_write would mark the WAL dirty again
+        await asyncio.get_running_loop().run_in_executor(WRITE_EXECUTOR, _checkpoint)
+
+def get_insert_queue() -> asyncio.Queue:
+    global _insert_queue, _flusher
+    if _flusher is None or _flusher.done():
+        _insert_queue = asyncio.Queue()
+        _flusher = asyncio.create_task(_flush_inserts(_insert_queue))
+    return _insert_queue
+
+def tool_errors(fn):
+    # Report failures to the client as an error payload instead of raising
+    @functools.wraps(fn)
+    async def wrapper(*args, **kwargs):
+        try:
+            return await fn(*args, **kwargs)
+        except Exception as e:
+            return {"status": "error", "message": str(e)}
+    return wrapper
+
+def to_cents(amount: Optional[float]) -> Optional[int]:
+    if amount is None:
+        return None
+    if not math.isfinite(amount) or abs(amount) > MAX_AMOUNT:
+        raise ValueError(f"amount must be a finite number no larger than {MAX_AMOUNT} in magnitude")
+    # Round the amount as typed: str() gives the shortest decimal form of the float
+    # (0.285, not 0.28499...), and half-cents of that round away from zero
+    return int(Decimal(str(amount)).quantize(CENT, rounding=ROUND_HALF_UP) * 100)
+
+def json_result(payload) -> ToolResult:
+    # Serialize row data once with orjson. FastMCP passes a ToolResult through as-is,
+    # instead of serializing the rows for the text content and again as structured content.
+    return ToolResult(content=orjson.dumps(payload).decode())
+
+class ExpenseEdit(BaseModel):
+    date: str
+    subcategory: str
+    amount: Optional[float] = None
+    category: Optional[str] = None
+    note: Optional[str] = None
+
+mcp = FastMCP("Expense Tracker")
+
+# Stored in the database's user_version once init_db() has brought the schema up to date
+SCHEMA_VERSION = 2
+
+def _table_options(*options):
+    # STRICT tables need SQLite 3.37+; older libraries get a plain table
+    if sqlite3.sqlite_version_info >= (3, 37, 0):
+        options += ("STRICT",)
+    return ", ".join(options)
+
 def init_db():
-    import sqlite3
-    with sqlite3.connect(DB_PATH) as c:
-        c.execute("""
+    c = _WRITE_CONN
+    if c.execute("PRAGMA user_version").fetchone()[0] < SCHEMA_VERSION:
+        _upgrade_schema(c)
+    # Fall back to the default journal if WAL can't be enabled (e.g. locked db)
+    for pragma in ("PRAGMA journal_mode=WAL", *PRAGMAS, *WRITER_PRAGMAS):
+        try:
+            c.execute(pragma)
+        except sqlite3.OperationalError:
+            pass
+
+def _upgrade_schema(c):
+    # Only takes effect before the first table is written to a new file
+    c.execute("PRAGMA page_size=4096")
+    with c:
+        c.execute("BEGIN")
+        # The rollup and its triggers are rebuilt from expenses below
+        for name in ROLLUP_TRIGGERS:
+            c.execute(f"DROP TRIGGER IF EXISTS {name}")
+        c.execute("DROP TABLE IF EXISTS expense_rollup")
+        c.execute("DROP INDEX IF EXISTS idx_expenses_date_cat_amt")
+
+        # Databases from before amounts were stored in cents have a REAL amount column
+        columns = [row[1] for row in c.execute("PRAGMA table_info(expenses)")]
+        legacy = "amount" in columns
+        if legacy:
+            c.execute("ALTER TABLE expenses RENAME TO expenses_v1")
+
+        c.execute(f"""
         CREATE TABLE IF NOT EXISTS expenses (
             id INTEGER PRIMARY KEY AUTOINCREMENT,
             date TEXT NOT NULL,
-            amount REAL NOT NULL,
+            amount_cents INTEGER NOT NULL,
             category TEXT NOT NULL,
             subcategory TEXT DEFAULT '',
             note TEXT DEFAULT ''
-        )
+        ) {_table_options()}
+        """)
+        if legacy:
+            c.execute("""
+            INSERT INTO expenses(id, date, amount_cents, category, subcategory, note)
+            -- Legacy REAL amounts are already float approximations, so ROUND() takes them as stored
+            SELECT id, date, CAST(ROUND(amount * 100) AS INTEGER), category, subcategory, note
+            FROM expenses_v1
+            """)
+            # Carry the AUTOINCREMENT counter over so ids of deleted rows aren't reused
+            c.execute("DELETE FROM sqlite_sequence WHERE name = 'expenses'")
+            c.execute("UPDATE sqlite_sequence SET name = 'expenses' WHERE name = 'expenses_v1'")
+            c.execute("DROP TABLE expenses_v1")
+
+        # (date) keeps entries in (date, id) order, so list_expenses pages without a sort;
+        # (date, subcategory) serves edit/delete lookups
+        c.execute("CREATE INDEX IF NOT EXISTS idx_expenses_date ON expenses(date)")
+        c.execute("CREATE INDEX IF NOT EXISTS idx_expenses_date_sub ON expenses(date, subcategory)")
+
+        c.execute(f"""
+        CREATE TABLE expense_rollup (
+            date TEXT NOT NULL,
+            category TEXT NOT NULL,
+            total_cents INTEGER NOT NULL,
+            cnt INTEGER NOT NULL,
+            PRIMARY KEY (date, category)
+        ) {_table_options("WITHOUT ROWID")}
+        """)
+        c.execute("CREATE INDEX idx_rollup_category_date ON expense_rollup(category, date, total_cents)")
+        c.execute("""
+        INSERT INTO expense_rollup(date, category, total_cents, cnt)
+        SELECT date, category, SUM(amount_cents), COUNT(*) FROM expenses GROUP BY date, category
         """)
+        for trigger in ROLLUP_TRIGGERS.values():
+            c.execute(trigger)
+        c.execute("ANALYZE")
+        c.execute(f"PRAGMA user_version = {SCHEMA_VERSION}")
 
 init_db()
 
 @mcp.tool
+@tool_errors
 async def add_expense(date: str, amount: float, category: str, subcategory: str = "", note: str = ""):
     '''
     Add a new expense entry. 
     Args:
         date: Date in YYYY-MM-DD format.
-        amount: The cost of the expense (numeric).
+        amount: The cost of the expense (numeric, stored to the cent).
         category: The main category (e.g., food, transport, housing, utilities, health, education etc).
         subcategory: Optional specific detail (e.g., groceries, fuel etc).
         note: Optional extra notes.
     '''
-    try:
-        async with aiosqlite.connect(DB_PATH) as c:
-            cur = await c.execute(
-                "INSERT INTO expenses(date, amount, category, subcategory, note) VALUES (?,?,?,?,?)",
-                (date, amount, category, subcategory, note)
-            )
-            await c.commit()
-        return {"status": "ok", "id": cur.lastrowid,"message": "Expense added successfully"}
-    except Exception as e:
-        return {"status": "error", "message": str(e)}
+    fut = asyncio.get_running_loop().create_future()
+    await get_insert_queue().put(((date, to_cents(amount), category, subcategory, note), fut))
+    return {"status": "ok", "id": await fut,"message": "Expense added successfully"}
     
 @mcp.tool()
-async def list_expenses(start_date: str, end_date: str):
-    '''List expense entries within an inclusive date range (YYYY-MM-DD).'''
-    try:
-        async with aiosqlite.connect(DB_PATH) as c:
-            cur = await c.execute(
-                """
-                SELECT id, date, amount, category, subcategory, note
-                FROM expenses
-                WHERE date BETWEEN ? AND ?
-                ORDER BY id ASC
-                """,
-                (start_date, end_date)
-            )
-            cols = [d[0] for d in cur.description]
-            return [dict(zip(cols, r)) for r in await cur.fetchall()]
-    except Exception as e:
-        return {"status": "error", "message": f"Error listing expenses: {str(e)}"}
+@tool_errors
+async def list_expenses(start_date: str, end_date: str, cursor: Optional[str] = None):
+    '''
+    List expense entries within an inclusive date range (YYYY-MM-DD).
+    Returns {"columns": [...], "rows": [[...], ...], "next_cursor": ...} with one row per expense.
+    Results come in pages; while next_cursor is not null, call again with it as cursor to get the rest.
+    '''
+    # ISO dates compare correctly as strings; an inverted range can't match anything
+    if start_date > end_date:
+        return json_result({"columns": LIST_COLUMNS, "rows": [], "next_cursor": None})
+    if cursor:
+        after_date, _, after_id = cursor.rpartition("|")
+    else:
+        after_date, after_id = start_date, 0
+    rows = await run_read(_query, LIST_SQL, (start_date, end_date, after_date, int(after_id), LIST_PAGE_SIZE))
+    next_cursor = f"{rows[-1][1]}|{rows[-1][0]}" if len(rows) == LIST_PAGE_SIZE else None
+    return json_result({"columns": LIST_COLUMNS, "rows": rows, "next_cursor": next_cursor})
     
 @mcp.tool()
+@tool_errors
 async def edit_expense(subcategory: str, date: str, amount: Optional[float] = None, category: Optional[str] = None, note: Optional[str] = None):
     '''
     Edit an existing expense entry identified by date and subcategory.
     Only provide the fields that need updating.
     '''
-    try:
-        async with aiosqlite.connect(DB_PATH) as c:
-            fields = []
-            params = []
-
-            if amount is not None:
-                fields.append("amount = ?")
-                params.append(amount)
-            if category is not None:
-                fields.append("category = ?")
-                params.append(category)
-            if note is not None:
-                fields.append("note = ?")
-                params.append(note)
-
-            if not fields:
-                return {"status": "no changes"}
-
-            params.extend([date, subcategory])
-            query = f"UPDATE expenses SET {', '.join(fields)} WHERE date = ? and subcategory = ?"
-            cur = await c.execute(query, params)
-            await c.commit()
-            return {"status": "ok", "rows_affected": cur.rowcount}
-    except Exception as e:
-        return {"status": "error", "message": str(e)}
+    if amount is None and category is None and note is None:
+        return {"status": "no changes"}
+
+    rowcount = await run_write(_write_many, UPDATE_SQL, [(to_cents(amount), category, note, date, subcategory)])
+    return {"status": "ok", "rows_affected": rowcount}
+
+@mcp.tool()
+@tool_errors
+async def edit_expenses(items: list[ExpenseEdit]):
+    '''
+    Edit several expense entries at once, in a single transaction.
+    Each item identifies an entry by date and subcategory; only provide the fields that need updating.
+    '''
+    params = [
+        (to_cents(i.amount), i.category, i.note, i.date, i.subcategory)
+        for i in items
+        if i.amount is not None or i.category is not None or i.note is not None
+    ]
+    if not params:
+        return {"status": "no changes"}
+
+    rowcount = await run_write(_write_many, UPDATE_SQL, params)
+    return {"status": "ok", "rows_affected": rowcount}
     
 @mcp.tool()
+@tool_errors
 async def delete_expense(date: str, subcategory: str):
     '''Delete an expense entry by its date (YYYY-MM-DD) and subcategory.'''
-    try:
-        async with aiosqlite.connect(DB_PATH) as c:
-            cur = await c.execute("DELETE FROM expenses WHERE date = ? and subcategory = ?", (date,subcategory))
-            await c.commit()
-            return {"status": "ok", "rows_affected": cur.rowcount}
-    except Exception as e:
-        return {"status": "error", "message": str(e)}
+    rowcount = await run_write(_write_many, DELETE_SQL, [(date, subcategory)])
+    return {"status": "ok", "rows_affected": rowcount}
+
+@mcp.tool()
+@tool_errors
+async def delete_expenses(items: list[tuple[str, str]]):
+    '''Delete several expense entries at once, each given as [date (YYYY-MM-DD), subcategory], in a single transaction.'''
+    rowcount = await run_write(_write_many, DELETE_SQL, items)
+    return {"status": "ok", "rows_affected": rowcount}
 
 @mcp.tool()
+@tool_errors
 async def summarize(start_date: str, end_date: str, category: Optional[str] = None):
-    '''Summarize expenses by category within a date range (YYYY-MM-DD).'''
-    try:
-        async with aiosqlite.connect(DB_PATH) as c:
-            query = (
-                """
-                SELECT category, SUM(amount) AS total_amount
-                FROM expenses
-                WHERE date BETWEEN ? AND ?
-                """
-            )
-            params = [start_date, end_date]
-
-            if category:
-                query += " AND category = ?"
-                params.append(category)
-
-            query += " GROUP BY category ORDER BY category ASC"
-
-            cur = await c.execute(query, params)
-            cols = [d[0] for d in cur.description]
-            return [dict(zip(cols, r)) for r in await cur.fetchall()]
-    except Exception as e:
-        return {"status": "error", "message": f"Error summarizing expenses: {str(e)}"}
+    '''
+    Summarize expenses by category within a date range (YYYY-MM-DD).
+    Returns {"columns": ["category", "total_amount"], "rows": [[...], ...]}.
+    '''
+    if start_date > end_date:
+        return json_result({"columns": SUMMARY_COLUMNS, "rows": []})
+    if category:
+        rows = await run_read(_query, SUMMARY_BY_CATEGORY_SQL, (start_date, end_date, category))
+    else:
+        rows = await run_read(_query, SUMMARY_SQL, (start_date, end_date))
+    return json_result({"columns": SUMMARY_COLUMNS, "rows": rows})
     
 @mcp.resource("expense:///categories",mime_type="application/json")
 def get_categories():
-    # Read fresh each time so you can edit the file without restarting
+    # Re-read only when the file's mtime changes, so edits still show up without restarting
     try:
-        with open(CATEGORIES_PATH, "r", encoding="utf-8") as f:
-            return f.read()
+        mtime = os.stat(CATEGORIES_PATH).st_mtime_ns
+        if mtime != _categories_cache["mtime"]:
+            with open(CATEGORIES_PATH, "r", encoding="utf-8") as f:
+                _categories_cache["data"] = f.read()
+            _categories_cache["mtime"] = mtime
+        return _categories_cache["data"]
     except Exception as e:
         return {"status": "error", "message": f"Error reading categories: {str(e)}"}
     